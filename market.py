@@ -1,16 +1,55 @@
+import asyncio
 import datetime
+import functools
 import logging.config
 from environs import Env
-from seller import download_stock
+from seller import download_stock, index_remnants, remnant_price, remnant_stock
 
-import requests
+import httpx
+import orjson
 
-from seller import divide, price_conversion
+from seller import (
+    async_ttl_cache,
+    check_stocks,
+    client,
+    divide,
+    leaf_errors,
+    retry_api,
+    send_chunks,
+)
 
 logger = logging.getLogger(__file__)
 
+ENDPOINT_URL = "https://api.partner.market.yandex.ru/"
 
-def get_product_list(page, campaign_id, access_token):
+
+@functools.lru_cache
+def get_headers(access_token):
+    """
+    Возвращает заголовки запросов к API Яндекс.Маркет.
+
+    Словарь собирается один раз для каждого токена и переиспользуется
+    во всех запросах. Заголовок Host не передаётся: httpx берёт его из URL,
+    а в HTTP/2 он отправляется как :authority.
+
+    Параметры:
+        access_token (str): Токен доступа к API Яндекс.Маркет.
+
+    Возвращает:
+        dict: Заголовки запроса.
+
+    Пример:
+        get_headers('access_token')
+    """
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}",
+        "Accept": "application/json",
+    }
+
+
+@retry_api
+async def get_product_list(page, campaign_id, access_token):
     """
     Получает список товаров с Яндекс.Маркет.
 
@@ -26,28 +65,23 @@ def get_product_list(page, campaign_id, access_token):
         get_product_list('page_token', '12345', 'access_token')
 
     Исключения:
-        - requests.exceptions.RequestException: Ошибки при отправке запроса.
+        - httpx.HTTPError: Ошибки при отправке запроса.
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {
         "page_token": page,
         "limit": 200,
     }
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-mapping-entries"
-    response = requests.get(url, headers=headers, params=payload)
+    url = ENDPOINT_URL + f"campaigns/{campaign_id}/offer-mapping-entries"
+    headers = get_headers(access_token)
+    response = await client.get(url, headers=headers, params=payload)
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object.get("result")
 
 
-def update_stocks(stocks, campaign_id, access_token):
-     """
+@retry_api
+async def update_stocks(stocks, campaign_id, access_token):
+    """
     Обновляет остатки товаров на Яндекс.Маркет.
 
     Параметры:
@@ -62,24 +96,19 @@ def update_stocks(stocks, campaign_id, access_token):
         update_stocks([{'sku': '12345', 'warehouseId': '1', 'items': [...]}, '12345', 'access_token']
 
     Исключения:
-        - requests.exceptions.RequestException: Ошибки при отправке запроса.
+        - httpx.HTTPError: Ошибки при отправке запроса.
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {"skus": stocks}
-    url = endpoint_url + f"campaigns/{campaign_id}/offers/stocks"
-    response = requests.put(url, headers=headers, json=payload)
+    url = ENDPOINT_URL + f"campaigns/{campaign_id}/offers/stocks"
+    headers = get_headers(access_token)
+    response = await client.put(url, headers=headers, content=orjson.dumps(payload))
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object
 
 
-def update_price(prices, campaign_id, access_token):
+@retry_api
+async def update_price(prices, campaign_id, access_token):
     """
     Обновляет цены товаров на Яндекс.Маркет.
 
@@ -95,24 +124,19 @@ def update_price(prices, campaign_id, access_token):
         update_price([{'id': '12345', 'price': {'value': 1000}}], '12345', 'access_token')
 
     Исключения:
-        - requests.exceptions.RequestException: Ошибки при отправке запроса.
+        - httpx.HTTPError: Ошибки при отправке запроса.
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {"offers": prices}
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-prices/updates"
-    response = requests.post(url, headers=headers, json=payload)
+    url = ENDPOINT_URL + f"campaigns/{campaign_id}/offer-prices/updates"
+    headers = get_headers(access_token)
+    response = await client.post(url, headers=headers, content=orjson.dumps(payload))
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object
 
 
-def get_offer_ids(campaign_id, market_token):
+@async_ttl_cache(ttl=300)
+async def get_offer_ids(campaign_id, market_token):
     """
     Получает артикулы товаров на Яндекс.Маркет по ID кампании.
 
@@ -127,109 +151,100 @@ def get_offer_ids(campaign_id, market_token):
         get_offer_ids('12345', 'access_token')
 
     Исключения:
-        - requests.exceptions.RequestException: Ошибки при отправке запроса.
+        - httpx.HTTPError: Ошибки при отправке запроса.
     """
-    page = ""
-    product_list = []
-    while True:
-        some_prod = get_product_list(page, campaign_id, market_token)
-        product_list.extend(some_prod.get("offerMappingEntries"))
-        page = some_prod.get("paging").get("nextPageToken")
-        if not page:
-            break
+    # Следующая страница запрашивается сразу, как только известен её токен,
+    # а артикулы текущей страницы разбираются, пока она загружается.
     offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer").get("shopSku"))
+    next_page = asyncio.ensure_future(get_product_list("", campaign_id, market_token))
+    while next_page is not None:
+        some_prod = await next_page
+        page = some_prod.get("paging").get("nextPageToken")
+        if page:
+            next_page = asyncio.ensure_future(
+                get_product_list(page, campaign_id, market_token)
+            )
+        else:
+            next_page = None
+        for product in some_prod.get("offerMappingEntries"):
+            offer_ids.append(product.get("offer").get("shopSku"))
     return offer_ids
 
 
-def create_stocks(watch_remnants, offer_ids, warehouse_id):
+def create_stocks(remnants, offer_ids, warehouse_id):
     """
     Создаёт список остатков для обновления на Яндекс.Маркет.
 
     Параметры:
-        watch_remnants (list): Список остатков с данными о товарах.
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
         offer_ids (list): Список артикулов товаров.
         warehouse_id (str): ID склада на Яндекс.Маркет.
 
     Возвращает:
-        list: Список словарей с остатками товаров для отправки на Яндекс.Маркет.
+        generator: Генератор словарей с остатками товаров для отправки на Яндекс.Маркет.
 
     Пример:
-        create_stocks([{'Код': '12345', 'Количество': '5'}], ['12345'], '1')
+        list(create_stocks({'12345': {'stock': 5, 'price': '1000'}}, ['12345'], '1'))
 
     Исключения:
-        Нет.
+        - ValueError: Количество загруженного товара не удалось разобрать.
     """
-    # Уберем то, что не загружено в market
-    stocks = list()
+    # Берём только то, что загружено в market
     date = str(datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z")
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
-            stocks.append(
-                {
-                    "sku": str(watch.get("Код")),
-                    "warehouseId": warehouse_id,
-                    "items": [
-                        {
-                            "count": stock,
-                            "type": "FIT",
-                            "updatedAt": date,
-                        }
-                    ],
-                }
-            )
-            offer_ids.remove(str(watch.get("Код")))
-    # Добавим недостающее из загруженного:
-    for offer_id in offer_ids:
-        stocks.append(
-            {
-                "sku": offer_id,
-                "warehouseId": warehouse_id,
-                "items": [
-                    {
-                        "count": 0,
-                        "type": "FIT",
-                        "updatedAt": date,
-                    }
-                ],
-            }
-        )
-    return stocks
+    for offer_id in dict.fromkeys(offer_ids):
+        stock = remnant_stock(remnants, offer_id)
+        yield make_stock(offer_id, warehouse_id, stock, date)
 
 
-def create_prices(watch_remnants, offer_ids):
+def make_stock(sku, warehouse_id, count, date):
+    """
+    Собирает запись об остатке товара для API Яндекс.Маркет.
+
+    Параметры:
+        sku (str): Артикул товара.
+        warehouse_id (str): ID склада на Яндекс.Маркет.
+        count (int): Количество товара на складе.
+        date (str): Дата обновления остатка в формате ISO 8601.
+
+    Возвращает:
+        dict: Запись об остатке товара.
+
+    Пример:
+        make_stock('12345', '1', 5, '2023-01-01T00:00:00Z')
+    """
+    return {
+        "sku": sku,
+        "warehouseId": warehouse_id,
+        "items": [{"count": count, "type": "FIT", "updatedAt": date}],
+    }
+
+
+def create_prices(remnants, offer_ids):
     """
     Создаёт список цен для обновления на Яндекс.Маркет.
 
     Параметры:
-        watch_remnants (list): Список остатков с данными о товарах.
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
         offer_ids (list): Список артикулов товаров.
 
     Возвращает:
         list: Список словарей с ценами товаров.
 
     Пример:
-        create_prices([{'Код': '12345', 'Цена': '1000'}], ['12345'])
+        create_prices({'12345': {'stock': 5, 'price': '1000'}}, ['12345'])
 
     Исключения:
         Нет.
     """
     prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
+    for offer_id in dict.fromkeys(offer_ids):
+        value = remnant_price(remnants, offer_id)
+        if value is not None:
             price = {
-                "id": str(watch.get("Код")),
+                "id": offer_id,
                 # "feed": {"id": 0},
                 "price": {
-                    "value": int(price_conversion(watch.get("Цена"))),
+                    "value": int(value),
                     # "discountBase": 0,
                     "currencyId": "RUR",
                     # "vat": 0,
@@ -241,26 +256,33 @@ def create_prices(watch_remnants, offer_ids):
     return prices
 
 
-async def upload_prices(watch_remnants, campaign_id, market_token):
-    offer_ids = get_offer_ids(campaign_id, market_token)
-    prices = create_prices(watch_remnants, offer_ids)
-    for some_prices in list(divide(prices, 500)):
-        update_price(some_prices, campaign_id, market_token)
+async def upload_prices(remnants, campaign_id, market_token):
+    offer_ids = await get_offer_ids(campaign_id, market_token)
+    prices = create_prices(remnants, offer_ids)
+    await send_chunks(update_price, divide(prices, 500), campaign_id, market_token)
     return prices
 
 
-async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id):
-    offer_ids = get_offer_ids(campaign_id, market_token)
-    stocks = create_stocks(watch_remnants, offer_ids, warehouse_id)
-    for some_stock in list(divide(stocks, 2000)):
-        update_stocks(some_stock, campaign_id, market_token)
-    not_empty = list(
-        filter(lambda stock: (stock.get("items")[0].get("count") != 0), stocks)
-    )
+async def upload_stocks(remnants, campaign_id, market_token, warehouse_id):
+    offer_ids = await get_offer_ids(campaign_id, market_token)
+    check_stocks(remnants, offer_ids)
+    stocks = []
+    not_empty = []
+
+    def collect(chunks):
+        for some_stock in chunks:
+            stocks.extend(some_stock)
+            not_empty.extend(
+                stock for stock in some_stock if stock.get("items")[0].get("count") != 0
+            )
+            yield some_stock
+
+    chunks = divide(create_stocks(remnants, offer_ids, warehouse_id), 2000)
+    await send_chunks(update_stocks, collect(chunks), campaign_id, market_token)
     return not_empty, stocks
 
 
-def main():
+async def main():
     env = Env()
     market_token = env.str("MARKET_TOKEN")
     campaign_fbs_id = env.str("FBS_ID")
@@ -268,32 +290,48 @@ def main():
     warehouse_fbs_id = env.str("WAREHOUSE_FBS_ID")
     warehouse_dbs_id = env.str("WAREHOUSE_DBS_ID")
 
-    watch_remnants = download_stock()
     try:
-        # FBS
-        offer_ids = get_offer_ids(campaign_fbs_id, market_token)
-        # Обновить остатки FBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_fbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_fbs_id, market_token)
-        # Поменять цены FBS
-        upload_prices(watch_remnants, campaign_fbs_id, market_token)
-
-        # DBS
-        offer_ids = get_offer_ids(campaign_dbs_id, market_token)
-        # Обновить остатки DBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_dbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_dbs_id, market_token)
-        # Поменять цены DBS
-        upload_prices(watch_remnants, campaign_dbs_id, market_token)
-    except requests.exceptions.ReadTimeout:
+        # Артикулы загружаются, пока скачивается и разбирается файл остатков;
+        # выгрузки ниже получат их из кэша get_offer_ids.
+        async with asyncio.TaskGroup() as group:
+            download = group.create_task(download_stock())
+            fbs_offer_ids = group.create_task(
+                get_offer_ids(campaign_fbs_id, market_token)
+            )
+            dbs_offer_ids = group.create_task(
+                get_offer_ids(campaign_dbs_id, market_token)
+            )
+        remnants = index_remnants(download.result())
+        # Файл проверяется для обеих кампаний до запуска выгрузок: ни остатки,
+        # ни цены не отправляются, если количество товара не разобралось.
+        check_stocks(remnants, fbs_offer_ids.result())
+        check_stocks(remnants, dbs_offer_ids.result())
+        async with asyncio.TaskGroup() as group:
+            # FBS
+            group.create_task(
+                upload_stocks(remnants, campaign_fbs_id, market_token, warehouse_fbs_id)
+            )
+            group.create_task(upload_prices(remnants, campaign_fbs_id, market_token))
+            # DBS
+            group.create_task(
+                upload_stocks(remnants, campaign_dbs_id, market_token, warehouse_dbs_id)
+            )
+            group.create_task(upload_prices(remnants, campaign_dbs_id, market_token))
+        get_offer_ids.cache_clear()
+    except* httpx.TimeoutException:
         print("Превышено время ожидания...")
-    except requests.exceptions.ConnectionError as error:
-        print(error, "Ошибка соединения")
-    except Exception as error:
-        print(error, "ERROR_2")
+    except* httpx.TransportError as errors:
+        for error in leaf_errors(errors):
+            print(error, "Ошибка соединения")
+    except* httpx.HTTPStatusError as errors:
+        for error in leaf_errors(errors):
+            print(error, "Ошибка API")
+    except* ValueError as errors:
+        for error in leaf_errors(errors):
+            print(error)
+    finally:
+        await client.aclose()
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
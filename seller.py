@@ -1,17 +1,171 @@
+import asyncio
+import functools
 import io
+import itertools
 import logging.config
-import os
 import re
+import time
 import zipfile
 from environs import Env
 
-import pandas as pd
-import requests
+import httpx
+import orjson
+import xlrd
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__file__)
 
+NON_DIGITS = re.compile("[^0-9]")
 
-def get_product_list(last_id, client_id, seller_token):
+STOCK_OVERRIDES = {">10": 100, "1": 0}
+
+client = httpx.AsyncClient(
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+)
+
+# 429 — превышен лимит запросов, 420 — то же самое в API Яндекс.Маркета
+RATE_LIMIT_STATUSES = {420, 429}
+
+
+def is_transient_error(error):
+    """
+    Проверяет, стоит ли повторить запрос после ошибки.
+
+    Повторяются таймауты, сетевые ошибки, ответы 5xx, а также 429 и 420
+    (превышен лимит запросов). Остальные ошибки 4xx повторять бессмысленно.
+
+    Аргументы:
+        error (Exception): Ошибка, возникшая при запросе.
+
+    Возвращает:
+        bool: True, если запрос можно повторить.
+
+    Пример:
+        >>> is_transient_error(httpx.ReadTimeout("timeout"))
+        True
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code in RATE_LIMIT_STATUSES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+
+def wait_retry_after(retry_state):
+    """
+    Возвращает паузу перед повтором запроса.
+
+    Если API прислал заголовок Retry-After в секундах, ждём столько, сколько
+    он просит (но не дольше 60 секунд). Иначе пауза растёт экспоненциально.
+
+    Аргументы:
+        retry_state (tenacity.RetryCallState): Состояние повторов tenacity.
+
+    Возвращает:
+        float: Пауза в секундах.
+    """
+    error = retry_state.outcome.exception()
+    if isinstance(error, httpx.HTTPStatusError):
+        retry_after = error.response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), 60)
+    return exponential_wait(retry_state)
+
+
+exponential_wait = wait_exponential(multiplier=0.5, max=30)
+
+retry_api = retry(
+    retry=retry_if_exception(is_transient_error),
+    wait=wait_retry_after,
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+
+
+def async_ttl_cache(ttl, maxsize=16):
+    """
+    Кэширует результат асинхронной функции на ttl секунд.
+
+    Ключом кэша служат позиционные аргументы. В кэш кладётся сама задача, поэтому
+    одновременные вызовы с одинаковыми аргументами ждут один и тот же запрос.
+    Каждый вызов ждёт задачу через asyncio.shield: отмена одного вызова не
+    отменяет запрос для остальных. Задачи, завершившиеся ошибкой, из кэша
+    удаляются, устаревшие записи вытесняются при добавлении новых, а при
+    переполнении вытесняется самая старая. Сбросить кэш можно через cache_clear().
+
+    Аргументы:
+        ttl (int): Время жизни записи в секундах.
+        maxsize (int): Максимальное количество записей в кэше.
+
+    Пример:
+        >>> @async_ttl_cache(ttl=300)
+        ... async def get_offer_ids(client_id, seller_token): ...
+    """
+
+    def decorator(func):
+        cache = {}
+
+        def forget_failed(key, task):
+            if not task.cancelled() and task.exception() is None:
+                return
+            if cache.get(key, (None, None))[1] is task:
+                del cache[key]
+
+        def store(key, task, now):
+            expired = [old_key for old_key, (expires, _) in cache.items() if expires <= now]
+            for old_key in expired:
+                del cache[old_key]
+            while len(cache) >= maxsize:
+                del cache[next(iter(cache))]
+            cache[key] = (now + ttl, task)
+
+        @functools.wraps(func)
+        async def wrapper(*args):
+            now = time.monotonic()
+            cached = cache.get(args)
+            if cached and cached[0] > now:
+                task = cached[1]
+            else:
+                task = asyncio.ensure_future(func(*args))
+                task.add_done_callback(functools.partial(forget_failed, args))
+                store(args, task, now)
+            return await asyncio.shield(task)
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+@functools.lru_cache
+def get_headers(client_id, seller_token):
+    """
+    Возвращает заголовки запросов к API Ozon.
+
+    Словарь собирается один раз для каждой пары ID клиента и токена
+    и переиспользуется во всех запросах.
+
+    Аргументы:
+        client_id (str): ID клиента для аутентификации в API Ozon.
+        seller_token (str): Токен продавца для доступа к API Ozon.
+
+    Возвращает:
+        dict: Заголовки запроса.
+
+    Пример:
+        >>> get_headers('client_id_example', 'token_example')
+        {'Content-Type': 'application/json', 'Client-Id': 'client_id_example', 'Api-Key': 'token_example'}
+    """
+    return {
+        "Content-Type": "application/json",
+        "Client-Id": client_id,
+        "Api-Key": seller_token,
+    }
+
+
+@retry_api
+async def get_product_list(last_id, client_id, seller_token):
     """
     Получает список товаров магазина Ozon.
 
@@ -36,10 +190,6 @@ def get_product_list(last_id, client_id, seller_token):
         []  # Если нет товаров с таким last_id, возвращается пустой список.
     """
     url = "https://api-seller.ozon.ru/v2/product/list"
-    headers = {
-        "Client-Id": client_id,
-        "Api-Key": seller_token,
-    }
     payload = {
         "filter": {
             "visibility": "ALL",
@@ -47,17 +197,21 @@ def get_product_list(last_id, client_id, seller_token):
         "last_id": last_id,
         "limit": 1000,
     }
-    response = requests.post(url, json=payload, headers=headers)
+    headers = get_headers(client_id, seller_token)
+    response = await client.post(url, content=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object.get("result")
 
 
-def get_offer_ids(client_id, seller_token):
+@async_ttl_cache(ttl=300)
+async def get_offer_ids(client_id, seller_token):
     """
     Получает артикулы товаров магазина Ozon.
 
     Функция делает несколько запросов к API Ozon для получения всех артикулов товаров магазина.
+    Страницы загружаются по цепочке last_id, поэтому параллельно их не запросить,
+    но запрос следующей страницы отправляется до обработки текущей.
 
     Аргументы:
         client_id (str): ID клиента для аутентификации в API Ozon.
@@ -74,22 +228,25 @@ def get_offer_ids(client_id, seller_token):
         >>> get_offer_ids('invalid_client', 'invalid_token')
         []  # Если не удаётся получить данные, вернётся пустой список.
     """
-    last_id = ""
-    product_list = []
-    while True:
-        some_prod = get_product_list(last_id, client_id, seller_token)
-        product_list.extend(some_prod.get("items"))
-        total = some_prod.get("total")
-        last_id = some_prod.get("last_id")
-        if total == len(product_list):
-            break
+    # Следующая страница запрашивается сразу, как только известен last_id,
+    # а артикулы текущей страницы разбираются, пока она загружается.
     offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer_id"))
+    next_page = asyncio.ensure_future(get_product_list("", client_id, seller_token))
+    while next_page is not None:
+        some_prod = await next_page
+        items = some_prod.get("items")
+        if some_prod.get("total") == len(offer_ids) + len(items):
+            next_page = None
+        else:
+            next_page = asyncio.ensure_future(
+                get_product_list(some_prod.get("last_id"), client_id, seller_token)
+            )
+        offer_ids.extend(product.get("offer_id") for product in items)
     return offer_ids
 
 
-def update_price(prices: list, client_id, seller_token):
+@retry_api
+async def update_price(prices: list, client_id, seller_token):
     """
     Обновляет цены товаров на Ozon.
 
@@ -113,17 +270,15 @@ def update_price(prices: list, client_id, seller_token):
         {'error': 'No prices to update'}
     """
     url = "https://api-seller.ozon.ru/v1/product/import/prices"
-    headers = {
-        "Client-Id": client_id,
-        "Api-Key": seller_token,
-    }
     payload = {"prices": prices}
-    response = requests.post(url, json=payload, headers=headers)
+    headers = get_headers(client_id, seller_token)
+    response = await client.post(url, content=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
-def update_stocks(stocks: list, client_id, seller_token):
+@retry_api
+async def update_stocks(stocks: list, client_id, seller_token):
     """
     Обновляет остатки товаров на Ozon.
 
@@ -147,22 +302,19 @@ def update_stocks(stocks: list, client_id, seller_token):
         {'error': 'No stocks to update'}
     """
     url = "https://api-seller.ozon.ru/v1/product/import/stocks"
-    headers = {
-        "Client-Id": client_id,
-        "Api-Key": seller_token,
-    }
     payload = {"stocks": stocks}
-    response = requests.post(url, json=payload, headers=headers)
+    headers = get_headers(client_id, seller_token)
+    response = await client.post(url, content=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
-def download_stock():
+async def download_stock():
     """
     Скачивает файл с остатками товаров с сайта Casio.
 
-    Эта функция загружает файл с остатками, распаковывает его и извлекает данные
-    из Excel файла для дальнейшего использования.
+    Эта функция загружает архив с остатками и разбирает его в отдельном потоке
+    (см. read_stock_file), чтобы не блокировать другие запросы к API.
 
     Возвращает:
         list: Список остатков товаров в формате словарей, где каждый словарь содержит
@@ -178,64 +330,273 @@ def download_stock():
     """
     # Скачать остатки с сайта
     casio_url = "https://timeworld.ru/upload/files/ostatki.zip"
-    session = requests.Session()
-    response = session.get(casio_url)
-    response.raise_for_status()
-    with response, zipfile.ZipFile(io.BytesIO(response.content)) as archive:
-        archive.extractall(".")
+    # Архив пишется в буфер по частям, без лишней копии в response.content
+    archive = io.BytesIO()
+    async with client.stream("GET", casio_url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            archive.write(chunk)
+    archive.seek(0)
+    return await asyncio.to_thread(read_stock_file, archive)
+
+
+def read_stock_file(archive_file):
+    """
+    Читает остатки товаров из архива с сайта Casio.
+
+    Excel файл построчно читается прямо из архива, без распаковки на диск.
+
+    Аргументы:
+        archive_file (file): Файловый объект с архивом ostatki.zip.
+
+    Возвращает:
+        list: Список остатков товаров в формате словарей.
+
+    Пример:
+        >>> read_stock_file(open('ostatki.zip', 'rb'))
+        [{'Код': 12345, 'Количество': '5'}, {'Код': 12346, 'Количество': '>10'}]
+    """
+    with zipfile.ZipFile(archive_file) as archive:
+        excel_file = archive.read("ostatki.xls")
     # Создаем список остатков часов:
-    excel_file = "ostatki.xls"
-    watch_remnants = pd.read_excel(
-        io=excel_file,
-        na_values=None,
-        keep_default_na=False,
-        header=17,
-    ).to_dict(orient="records")
-    os.remove("./ostatki.xls")  # Удалить файл
+    sheet = xlrd.open_workbook(file_contents=excel_file).sheet_by_index(0)
+    header_row = 17
+    headers = make_headers([cell_value(cell) for cell in sheet.row(header_row)])
+    watch_remnants = [
+        dict(zip(headers, map(cell_value, sheet.row(row))))
+        for row in range(header_row + 1, sheet.nrows)
+    ]
     return watch_remnants
 
 
-def create_stocks(watch_remnants, offer_ids):
+def make_headers(names):
     """
-    Создаёт список остатков для товаров на Ozon.
+    Собирает заголовки столбцов так же, как pandas.read_excel.
+
+    Пустые заголовки получают имя "Unnamed: N", где N — номер столбца.
+    Повторяющиеся имена получают суффиксы ".1", ".2" и т.д., причём первый
+    столбец сохраняет исходное имя, а суффикс, уже занятый другим столбцом,
+    пропускается. Без этого при сборке словаря строки более поздний столбец
+    с тем же именем перезаписал бы первый.
+
+    Аргументы:
+        names (list): Значения ячеек строки заголовков.
+
+    Возвращает:
+        list: Заголовки без повторов.
+
+    Пример:
+        >>> make_headers(['Код', 'Цена', '', 'Цена', 'Цена.1'])
+        ['Код', 'Цена', 'Unnamed: 2', 'Цена.2', 'Цена.1']
+    """
+    headers = [
+        name if name != "" else f"Unnamed: {column}"
+        for column, name in enumerate(names)
+    ]
+    unnamed = [column for column, name in enumerate(names) if name == ""]
+    named = [column for column, name in enumerate(names) if name != ""]
+    # Как и в pandas, сначала обрабатываются именованные столбцы
+    counts = {}
+    for column in named + unnamed:
+        name = headers[column]
+        original_name = name
+        count = counts.get(name, 0)
+        if count > 0:
+            while count > 0:
+                counts[original_name] = count + 1
+                name = f"{original_name}.{count}"
+                if name in headers:
+                    count += 1
+                else:
+                    count = counts.get(name, 0)
+            headers[column] = name
+        counts[name] = count + 1
+    return headers
+
+
+def cell_value(cell):
+    """
+    Возвращает значение ячейки Excel в том виде, в каком его отдавал pandas.
 
-    Эта функция фильтрует остатки, чтобы оставить только те товары, которые
-    уже загружены на Ozon, и добавляет недостающие товары с нулевым остатком.
+    xlrd хранит все числа как float, поэтому целые числа (например, коды
+    товаров) приводятся к int, чтобы str(watch.get("Код")) давал "12345",
+    а не "12345.0".
+
+    Аргументы:
+        cell (xlrd.sheet.Cell): Ячейка листа Excel.
+
+    Возвращает:
+        Значение ячейки: int, float, bool или str. Пустая ячейка — пустая строка.
+
+    Пример:
+        >>> cell_value(xlrd.sheet.Cell(xlrd.XL_CELL_NUMBER, 12345.0))
+        12345
+    """
+    if cell.ctype == xlrd.XL_CELL_NUMBER and cell.value.is_integer():
+        return int(cell.value)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    return cell.value
+
+
+def index_remnants(watch_remnants):
+    """
+    Индексирует остатки по коду товара.
+
+    Позволяет находить остаток по артикулу за O(1), вместо того чтобы
+    просматривать весь список для каждого товара. Остаток и цена разбираются
+    здесь один раз, а не в каждой выгрузке. Если код встречается несколько раз,
+    используется первая строка. Строки без кода пропускаются. Если количество
+    или цену разобрать не удалось, вместо значения сохраняется None; что с ним
+    делать, решают remnant_stock и remnant_price, и только для товаров,
+    загруженных на маркетплейс.
 
     Аргументы:
         watch_remnants (list): Список словарей с остатками товаров.
+
+    Возвращает:
+        dict: Словарь, где ключ — код товара в виде строки, а значение — словарь
+              с остатком ("stock", int или None) и ценой ("price", str или None).
+
+    Пример:
+        >>> index_remnants([{'Код': 12345, 'Количество': '>10', 'Цена': "5'990.00 руб."}])
+        {'12345': {'stock': 100, 'price': '5990'}}
+
+    Некорректное использование:
+        >>> index_remnants([])
+        {}
+    """
+    remnants = {}
+    for watch in watch_remnants:
+        code = watch.get("Код")
+        if code is None or code == "":
+            continue
+        code = str(code)
+        if code in remnants:
+            continue
+        try:
+            stock = stock_conversion(watch.get("Количество"))
+        except ValueError:
+            stock = None
+        price = price_conversion(str(watch.get("Цена")))
+        remnants[code] = {"stock": stock, "price": price or None}
+    return remnants
+
+
+def remnant_stock(remnants, offer_id):
+    """
+    Возвращает остаток загруженного товара из индекса остатков.
+
+    Товарам, которых нет в файле, ставится нулевой остаток.
+
+    Аргументы:
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
+        offer_id (str): Артикул товара на маркетплейсе.
+
+    Возвращает:
+        int: Остаток товара.
+
+    Пример:
+        >>> remnant_stock({'12345': {'stock': 5, 'price': '5990'}}, '12345')
+        5
+
+    Некорректное использование:
+        >>> remnant_stock({'12345': {'stock': None, 'price': '5990'}}, '12345')
+        ValueError: Не удалось разобрать количество товара 12345 в файле остатков
+    """
+    watch = remnants.get(offer_id)
+    if watch is None:
+        return 0
+    if watch["stock"] is None:
+        raise ValueError(
+            f"Не удалось разобрать количество товара {offer_id} в файле остатков"
+        )
+    return watch["stock"]
+
+
+def check_stocks(remnants, offer_ids):
+    """
+    Проверяет, что остатки всех загруженных товаров удалось разобрать.
+
+    Вызывается до первой отправки, чтобы ошибка в файле остатков
+    не оставила на маркетплейсе часть обновлений.
+
+    Аргументы:
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
+        offer_ids (list): Список артикулов товаров на маркетплейсе.
+
+    Возвращает:
+        None
+
+    Пример:
+        >>> check_stocks({'12345': {'stock': 5, 'price': '5990'}}, ['12345'])
+
+    Некорректное использование:
+        >>> check_stocks({'12345': {'stock': None, 'price': '5990'}}, ['12345'])
+        ValueError: Не удалось разобрать количество товара 12345 в файле остатков
+    """
+    for offer_id in offer_ids:
+        remnant_stock(remnants, offer_id)
+
+
+def remnant_price(remnants, offer_id):
+    """
+    Возвращает цену загруженного товара из индекса остатков.
+
+    Если цену товара не удалось разобрать, это пишется в лог, а цена товара
+    не обновляется: остальные цены выгружаются как обычно.
+
+    Аргументы:
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
+        offer_id (str): Артикул товара на маркетплейсе.
+
+    Возвращает:
+        str: Цена товара без разделителей или None, если товара нет в файле
+             или его цену не удалось разобрать.
+
+    Пример:
+        >>> remnant_price({'12345': {'stock': 5, 'price': '5990'}}, '12345')
+        '5990'
+
+    Некорректное использование:
+        >>> remnant_price({'12345': {'stock': 5, 'price': None}}, '12345')
+        None  # В лог пишется предупреждение, цена товара не выгружается.
+    """
+    watch = remnants.get(offer_id)
+    if watch is None:
+        return None
+    if watch["price"] is None:
+        logger.warning("Не удалось разобрать цену товара %s в файле остатков", offer_id)
+    return watch["price"]
+
+
+def create_stocks(remnants, offer_ids):
+    """
+    Создаёт список остатков для товаров на Ozon.
+
+    Эта функция проходит по товарам, которые уже загружены на Ozon, и берёт
+    их остаток из файла. Товарам, которых нет в файле, ставится нулевой остаток.
+
+    Аргументы:
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
         offer_ids (list): Список артикулов товаров на Ozon.
 
     Возвращает:
-        list: Список словарей с остатками товаров для загрузки на Ozon.
+        generator: Генератор словарей с остатками товаров для загрузки на Ozon.
 
     Пример:
-        >>> create_stocks([{'Код': '12345', 'Количество': '5'}], ['12345'])
+        >>> list(create_stocks({'12345': {'stock': 5, 'price': '5990'}}, ['12345']))
         [{'offer_id': '12345', 'stock': 5}]
 
     Некорректное использование:
-        >>> create_stocks([], [])
+        >>> list(create_stocks({}, []))
         []
     """
-    stocks = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
-            stocks.append({"offer_id": str(watch.get("Код")), "stock": stock})
-            offer_ids.remove(str(watch.get("Код")))
-    # Добавим недостающее из загруженного:
-    for offer_id in offer_ids:
-        stocks.append({"offer_id": offer_id, "stock": 0})
-    return stocks
+    for offer_id in dict.fromkeys(offer_ids):
+        yield {"offer_id": offer_id, "stock": remnant_stock(remnants, offer_id)}
 
 
-def create_prices(watch_remnants, offer_ids):
+def create_prices(remnants, offer_ids):
     """
     Создаёт список цен для товаров на Ozon.
 
@@ -243,34 +604,62 @@ def create_prices(watch_remnants, offer_ids):
     используя данные из списка остатков.
 
     Аргументы:
-        watch_remnants (list): Список словарей с остатками товаров.
+        remnants (dict): Остатки товаров, проиндексированные index_remnants.
         offer_ids (list): Список артикулов товаров на Ozon.
 
     Возвращает:
         list: Список словарей с ценами товаров для загрузки на Ozon.
 
     Пример:
-        >>> create_prices([{'Код': '12345', 'Цена': "5'990.00 руб."}], ['12345'])
+        >>> create_prices({'12345': {'stock': 5, 'price': '5990'}}, ['12345'])
         [{'offer_id': '12345', 'price': '5990'}]
 
     Некорректное использование:
-        >>> create_prices([], [])
+        >>> create_prices({}, [])
         []
     """
     prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
+    for offer_id in dict.fromkeys(offer_ids):
+        value = remnant_price(remnants, offer_id)
+        if value is not None:
             price = {
                 "auto_action_enabled": "UNKNOWN",
                 "currency_code": "RUB",
-                "offer_id": str(watch.get("Код")),
+                "offer_id": offer_id,
                 "old_price": "0",
-                "price": price_conversion(watch.get("Цена")),
+                "price": value,
             }
             prices.append(price)
     return prices
 
 
+def stock_conversion(count) -> int:
+    """
+    Преобразует количество из файла остатков в остаток для маркетплейса.
+
+    ">10" выгружается как 100, а "1" — как 0 (см. STOCK_OVERRIDES).
+    Остальные значения приводятся к int.
+
+    Аргументы:
+        count (str | int): Количество товара из файла остатков.
+
+    Возвращает:
+        int: Остаток товара.
+
+    Пример:
+        >>> stock_conversion(">10")
+        100
+
+    Некорректное использование:
+        >>> stock_conversion("")
+        ValueError: invalid literal for int() with base 10: ''
+    """
+    stock = STOCK_OVERRIDES.get(count if isinstance(count, str) else str(count))
+    if stock is None:
+        stock = int(count)
+    return stock
+
+
 def price_conversion(price: str) -> str:
     """
     Преобразует цену из строки формата "5'990.00 руб." в числовой формат без разделителей.
@@ -292,18 +681,19 @@ def price_conversion(price: str) -> str:
         >>> price_conversion("1000 руб.")
         '1000'
     """
-    return re.sub("[^0-9]", "", price.split(".")[0])
+    return NON_DIGITS.sub("", price.split(".", 1)[0])
 
 
-def divide(lst: list, n: int):
+def divide(lst, n: int):
     """
     Разделяет список на части.
 
     Эта функция разделяет исходный список на несколько частей, каждая из которых
-    имеет не более n элементов.
+    имеет не более n элементов. Вместо списка можно передать генератор: части
+    формируются по мере чтения, без промежуточного списка.
 
     Аргументы:
-        lst (list): Список, который нужно разделить.
+        lst (iterable): Список или генератор, который нужно разделить.
         n (int): Максимальное количество элементов в каждой части.
 
     Возвращает:
@@ -318,49 +708,126 @@ def divide(lst: list, n: int):
         >>> list(divide([], 2))
         []  # Пустой список остаётся пустым, не вызывает ошибок.
     """
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+    items = iter(lst)
+    while chunk := list(itertools.islice(items, n)):
+        yield chunk
+
 
+async def send_chunks(update, chunks, *args, limit=8):
+    """
+    Отправляет части списка в API параллельно.
 
-async def upload_prices(watch_remnants, client_id, seller_token):
-    offer_ids = get_offer_ids(client_id, seller_token)
-    prices = create_prices(watch_remnants, offer_ids)
-    for some_price in list(divide(prices, 1000)):
-        update_price(some_price, client_id, seller_token)
+    Части отправляют limit задач, каждая берёт следующую часть из chunks, как
+    только освободится. Поэтому одновременно выполняется не более limit
+    запросов, а генератор частей читается по мере отправки и не собирается
+    в список целиком. Задачи запускаются в asyncio.TaskGroup: при первой
+    ошибке остальные отправки отменяются, а ошибка выбрасывается в составе
+    ExceptionGroup.
+
+    Аргументы:
+        update (coroutine function): Функция обновления, например update_stocks.
+        chunks (iterable): Части списка, полученные из divide.
+        *args: Остальные аргументы функции обновления (ID клиента, токен и т.д.).
+        limit (int): Максимальное количество одновременных запросов.
+
+    Возвращает:
+        list: Ответы API для каждой части в исходном порядке.
+
+    Пример:
+        >>> await send_chunks(update_stocks, divide(stocks, 100), 'client_id_example', 'token_example')
+        [{'result': 'success'}]
+    """
+    numbered_chunks = enumerate(chunks)
+    responses = {}
+
+    async def send():
+        for number, chunk in numbered_chunks:
+            responses[number] = await update(chunk, *args)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(limit):
+            group.create_task(send())
+    return [responses[number] for number in sorted(responses)]
+
+
+async def upload_prices(remnants, client_id, seller_token):
+    offer_ids = await get_offer_ids(client_id, seller_token)
+    prices = create_prices(remnants, offer_ids)
+    await send_chunks(update_price, divide(prices, 1000), client_id, seller_token)
     return prices
 
 
-async def upload_stocks(watch_remnants, client_id, seller_token):
-    offer_ids = get_offer_ids(client_id, seller_token)
-    stocks = create_stocks(watch_remnants, offer_ids)
-    for some_stock in list(divide(stocks, 100)):
-        update_stocks(some_stock, client_id, seller_token)
-    not_empty = list(filter(lambda stock: (stock.get("stock") != 0), stocks))
+async def upload_stocks(remnants, client_id, seller_token):
+    offer_ids = await get_offer_ids(client_id, seller_token)
+    check_stocks(remnants, offer_ids)
+    stocks = []
+    not_empty = []
+
+    def collect(chunks):
+        for some_stock in chunks:
+            stocks.extend(some_stock)
+            not_empty.extend(stock for stock in some_stock if stock.get("stock") != 0)
+            yield some_stock
+
+    chunks = divide(create_stocks(remnants, offer_ids), 100)
+    await send_chunks(update_stocks, collect(chunks), client_id, seller_token)
     return not_empty, stocks
 
 
-def main():
+def leaf_errors(error):
+    """
+    Перебирает ошибки из ExceptionGroup, включая вложенные группы.
+
+    Аргументы:
+        error (BaseException): Ошибка или группа ошибок из asyncio.TaskGroup.
+
+    Возвращает:
+        generator: Генератор отдельных ошибок.
+
+    Пример:
+        >>> list(leaf_errors(ExceptionGroup("", [ValueError(1), ExceptionGroup("", [KeyError(2)])])))
+        [ValueError(1), KeyError(2)]
+    """
+    if isinstance(error, BaseExceptionGroup):
+        for inner_error in error.exceptions:
+            yield from leaf_errors(inner_error)
+    else:
+        yield error
+
+
+async def main():
     env = Env()
     seller_token = env.str("SELLER_TOKEN")
     client_id = env.str("CLIENT_ID")
     try:
-        offer_ids = get_offer_ids(client_id, seller_token)
-        watch_remnants = download_stock()
-        # Обновить остатки
-        stocks = create_stocks(watch_remnants, offer_ids)
-        for some_stock in list(divide(stocks, 100)):
-            update_stocks(some_stock, client_id, seller_token)
-        # Поменять цены
-        prices = create_prices(watch_remnants, offer_ids)
-        for some_price in list(divide(prices, 900)):
-            update_price(some_price, client_id, seller_token)
-    except requests.exceptions.ReadTimeout:
+        # Артикулы загружаются, пока скачивается и разбирается файл остатков;
+        # выгрузки ниже получат их из кэша get_offer_ids.
+        async with asyncio.TaskGroup() as group:
+            download = group.create_task(download_stock())
+            offer_ids = group.create_task(get_offer_ids(client_id, seller_token))
+        remnants = index_remnants(download.result())
+        # Файл проверяется целиком до запуска выгрузок: ни остатки, ни цены
+        # не отправляются, если количество какого-то товара не разобралось.
+        check_stocks(remnants, offer_ids.result())
+        # Обновить остатки и поменять цены
+        async with asyncio.TaskGroup() as group:
+            group.create_task(upload_stocks(remnants, client_id, seller_token))
+            group.create_task(upload_prices(remnants, client_id, seller_token))
+        get_offer_ids.cache_clear()
+    except* httpx.TimeoutException:
         print("Превышено время ожидания...")
-    except requests.exceptions.ConnectionError as error:
-        print(error, "Ошибка соединения")
-    except Exception as error:
-        print(error, "ERROR_2")
+    except* httpx.TransportError as errors:
+        for error in leaf_errors(errors):
+            print(error, "Ошибка соединения")
+    except* httpx.HTTPStatusError as errors:
+        for error in leaf_errors(errors):
+            print(error, "Ошибка API")
+    except* ValueError as errors:
+        for error in leaf_errors(errors):
+            print(error)
+    finally:
+        await client.aclose()
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())